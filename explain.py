@@ -2,74 +2,104 @@
 import streamlit as st
 import streamlit.components.v1 as components # Import components
 import google.generativeai as genai
-from gtts import gTTS
+import edge_tts
 from deep_translator import GoogleTranslator
+from deep_translator.exceptions import RequestError, TooManyRequests
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 from PIL import Image
+from concurrent.futures import ThreadPoolExecutor, wait
+import asyncio
+import collections
+import functools
+import hashlib
 import io
 import os
+import re
 import time
 import traceback
+import requests
 
 # --- Configuration & API Key Handling ---
-GOOGLE_API_KEY = None
-API_KEY_SOURCE = "Not Set"
-
-# 1. Try getting API key from Streamlit secrets (priority)
-try:
-    if 'GOOGLE_API_KEY' in st.secrets:
-        GOOGLE_API_KEY = st.secrets["GOOGLE_API_KEY"]
-        API_KEY_SOURCE = "Streamlit Secrets"
-    else:
-         # Check environment variable as a fallback (common for local dev)
+@st.cache_resource(show_spinner=False)
+def _resolve_api_key():
+    """Resolves (api_key, source) once per process: secrets -> environment -> hardcoded placeholder."""
+    api_key = None
+    source = "Not Set"
+
+    # 1. Try getting API key from Streamlit secrets (priority)
+    try:
+        if 'GOOGLE_API_KEY' in st.secrets:
+            api_key = st.secrets["GOOGLE_API_KEY"]
+            source = "Streamlit Secrets"
+        else:
+             # Check environment variable as a fallback (common for local dev)
+            if 'GOOGLE_API_KEY' in os.environ:
+                 api_key = os.environ.get('GOOGLE_API_KEY')
+                 source = "Environment Variable"
+            else:
+                 # Last fallback: Hardcoded placeholder (least secure, requires user action)
+                 # IMPORTANT: Replace only if you understand the security risk
+                 _placeholder_key = 'YOUR_API_KEY_HERE' # Replace ONLY if absolutely necessary
+                 if _placeholder_key != 'YOUR_API_KEY_HERE':
+                      api_key = _placeholder_key
+                      source = "Hardcoded Script (Not Recommended)"
+
+    except Exception as e:
+        st.warning(f"Could not read Streamlit secrets: {e}. Will check environment variables / placeholders.")
+        # Attempt fallback check even if secrets access failed
         if 'GOOGLE_API_KEY' in os.environ:
-             GOOGLE_API_KEY = os.environ.get('GOOGLE_API_KEY')
-             API_KEY_SOURCE = "Environment Variable"
+            api_key = os.environ.get('GOOGLE_API_KEY')
+            source = "Environment Variable (after secrets error)"
         else:
-             # Last fallback: Hardcoded placeholder (least secure, requires user action)
-             # IMPORTANT: Replace only if you understand the security risk
-             _placeholder_key = 'YOUR_API_KEY_HERE' # Replace ONLY if absolutely necessary
-             if _placeholder_key != 'YOUR_API_KEY_HERE':
-                  GOOGLE_API_KEY = _placeholder_key
-                  API_KEY_SOURCE = "Hardcoded Script (Not Recommended)"
-
-except Exception as e:
-    st.warning(f"Could not read Streamlit secrets: {e}. Will check environment variables / placeholders.")
-    # Attempt fallback check even if secrets access failed
-    if 'GOOGLE_API_KEY' in os.environ:
-        GOOGLE_API_KEY = os.environ.get('GOOGLE_API_KEY')
-        API_KEY_SOURCE = "Environment Variable (after secrets error)"
-    else:
-        _placeholder_key = 'YOUR_API_KEY_HERE'
-        if _placeholder_key != 'YOUR_API_KEY_HERE':
-            GOOGLE_API_KEY = _placeholder_key
-            API_KEY_SOURCE = "Hardcoded Script (Not Recommended, after secrets error)"
+            _placeholder_key = 'YOUR_API_KEY_HERE'
+            if _placeholder_key != 'YOUR_API_KEY_HERE':
+                api_key = _placeholder_key
+                source = "Hardcoded Script (Not Recommended, after secrets error)"
+
+    return api_key, source
+
+GOOGLE_API_KEY, API_KEY_SOURCE = _resolve_api_key()
 
 
 # --- Helper Functions ---
+MAX_LOG_LINES = 30 # Keep log concise; the deque drops the oldest lines itself
+DEBUG = os.environ.get('SCREENEXPLAINER_DEBUG', '') == '1' # Also log (trimmed) tracebacks on errors
+
 def log_message(message):
     """Appends a message to the log display."""
-    if 'log_messages' not in st.session_state: st.session_state.log_messages = []
+    if 'log_messages' not in st.session_state: st.session_state.log_messages = collections.deque(maxlen=MAX_LOG_LINES)
     # Prepend timestamp and message
-    st.session_state.log_messages.insert(0, f"{time.strftime('%H:%M:%S')}: {message}")
-    # Keep log concise (optional)
-    max_log_lines = 30
-    if len(st.session_state.log_messages) > max_log_lines:
-        st.session_state.log_messages = st.session_state.log_messages[:max_log_lines]
+    st.session_state.log_messages.appendleft(f"{time.strftime('%H:%M:%S')}: {message}")
+
+def notify(kind, message):
+    """Shows st.error/st.warning now and keeps it for the rerun that ends the action (see run_pending_action)."""
+    getattr(st, kind)(message)
+    st.session_state.action_notices.append((kind, message))
 
 # --- Initialize Session State --- (Moved before configure_gemini)
 default_values = {
-    'log_messages': ["Welcome! Ready for input."], 'processing': False,
-    'current_audio_data': None, 'current_text_to_speak': "",
-    'last_explanation': "", 'last_uploaded_image': None, 'action_trigger': None,
+    'log_messages': collections.deque(["Welcome! Ready for input."], maxlen=MAX_LOG_LINES),
+    'current_audio_chunks': [], 'current_audio_futures': [], 'current_text_to_speak': "",
+    'last_explanation': "", 'last_uploaded_image_hash': None,
+    'last_uploaded_image_blob': None,
     'tts_lang_code': 'en', 'translate_lang_code': None,
     'translate_lang_name': 'None (Original Language)', 'gemini_model': None,
     'api_key_configured': False,
     'audio_speed': 1.0, # Default audio speed
+    'pending_action': None, 'action_notices': [],
 }
 for key, value in default_values.items():
     if key not in st.session_state: st.session_state[key] = value
 
 # --- Configure Gemini --- (Now checks API key explicitly)
+GEMINI_MODEL_NAME = 'gemini-2.0-flash'
+
+@st.cache_resource(show_spinner=False)
+def _get_model(api_key, model_name=GEMINI_MODEL_NAME):
+    """Configures the SDK and builds the model once per process; shared by all sessions using the same key."""
+    genai.configure(api_key=api_key)
+    return genai.GenerativeModel(model_name)
+
 def configure_gemini():
     """Configures the Gemini API if not already done and API key is valid."""
     # Check if already configured successfully in this session
@@ -92,12 +122,8 @@ def configure_gemini():
     # Attempt configuration
     try:
         log_message(f"Attempting to configure Gemini API (Key source: {API_KEY_SOURCE})...")
-        genai.configure(api_key=GOOGLE_API_KEY)
-
-        # Specify the model name - sticking to 1.5-flash for now
-        model_name = 'gemini-2.0-flash'
-        log_message(f"Initializing Gemini model: {model_name}...")
-        model = genai.GenerativeModel(model_name)
+        log_message(f"Initializing Gemini model: {GEMINI_MODEL_NAME}...")
+        model = _get_model(GOOGLE_API_KEY) # Cached across reruns and sessions; failures are not cached
 
         log_message("Gemini configured and model initialized successfully.")
         st.session_state.gemini_model = model # Cache the model
@@ -113,48 +139,160 @@ def configure_gemini():
 
 
 # --- Other Helper Functions (clean_text_for_speech, etc.) ---
+# Characters dropped outright by clean_text_for_speech (markdown and grouping symbols)
+_SPEECH_DELETE_TABLE = str.maketrans('', '', '*`~()[]{}')
+# Symbols spelled out for TTS
+_SPEECH_SUB_MAP = {
+    '&': ' and ',
+    '%': ' percent ',
+    '=': ' equals ',
+    '≈': ' approximately ',
+    '∝': ' proportional to ',
+    '×': ' multiplied by ',
+    '÷': ' divided by ',
+    '°': ' degrees ',
+    '+': ' plus ',
+    '-': ' minus ',
+}
+_WS_RE = re.compile(r'\s+') # Any whitespace run (newlines included) collapses to one space
+# Longest keys first so multi-char symbols win over their prefixes
+_SPEECH_SUB_RE = re.compile('|'.join(re.escape(k) for k in sorted(_SPEECH_SUB_MAP, key=len, reverse=True)))
+
+def make_executor(max_workers):
+    """Creates a thread pool whose workers share this script run's context (session_state, caches)."""
+    return ThreadPoolExecutor(max_workers=max_workers, initializer=add_script_run_ctx, initargs=(None, get_script_run_ctx()))
+
+@st.cache_data(ttl=3600, max_entries=128, show_spinner=False) # Pure function, safe to memoize
 def clean_text_for_speech(text):
     """Applies cleaning rules to make text more suitable for TTS."""
     if not isinstance(text, str): # Add check if text is not string
         log_message(f"Warning: Attempting to clean non-string type: {type(text)}")
         text = str(text) # Attempt to convert
 
-    text = text.replace('\n', ' ').replace('  ', ' ')
-    text = text.replace('**', '').replace('*', '')
-    text = text.replace('`', '').replace('~', '')
-    text = text.replace('(', '').replace(')', '')
-    text = text.replace('[', '').replace(']', '')
-    text = text.replace('{', '').replace('}', '')
-    text = text.replace('&', ' and ')
-    text = text.replace('%', ' percent ')
-    text = text.replace('=', ' equals ')
-    text = text.replace('≈', ' approximately ')
-    text = text.replace('∝', ' proportional to ')
-    text = text.replace('×', ' multiplied by ')
-    text = text.replace('÷', ' divided by ')
-    text = text.replace('°', ' degrees ')
-    text = text.replace('+', ' plus ').replace('-', ' minus ')
-    text = ' '.join(text.split()) # Remove extra whitespace
+    text = text.translate(_SPEECH_DELETE_TABLE) # Markdown/grouping chars in one pass
+    text = _SPEECH_SUB_RE.sub(lambda m: _SPEECH_SUB_MAP[m.group(0)], text) # Spell out symbols in one pass
+    text = _WS_RE.sub(' ', text).strip() # Remove extra whitespace (newlines included)
     return text
 
+# edge-tts neural voice for each TTS language code offered in the sidebar
+EDGE_TTS_VOICES = {
+    "en": "en-US-AriaNeural",
+    "en-gb": "en-GB-SoniaNeural",
+    "es": "es-ES-ElviraNeural",
+    "fr": "fr-FR-DeniseNeural",
+    "de": "de-DE-KatjaNeural",
+    "it": "it-IT-ElsaNeural",
+    "ja": "ja-JP-NanamiNeural",
+    "te": "te-IN-ShrutiNeural",
+    "hi": "hi-IN-SwaraNeural",
+}
+TTS_CHUNK_SIZE = 600 # Sentence-packed pieces, one edge-tts request each
+# The only TTS concurrency limit: size of the thread pools that call _synthesize_speech (one websocket per
+# worker), both in generate_speech and in the streaming pipeline. Keeps us clear of service throttling
+TTS_MAX_CONCURRENCY = 4
+TTS_AUDIO_FORMAT = "audio/mpeg" # edge-tts always returns 24 kHz 48 kbps mono MP3 (~6 KB per second of speech)
+
+# edge-tts has no reusable client: each Communicate opens its own websocket, and its aiohttp session closes any
+# connector passed in, so sharing one across chunks would break. The Gemini client is cached in _get_model.
+async def _synthesize(text, voice):
+    """Streams one edge-tts request and returns its MP3 bytes."""
+    audio = bytearray()
+    async for message in edge_tts.Communicate(text, voice).stream():
+        if message["type"] == "audio":
+            audio += message["data"]
+    return bytes(audio)
+
+# Streamed explanations store one entry per chunk, so keep room for a few dozen explanations.
+# Memory only: MP3 chunks are large and cheap to regenerate, so they are not worth keeping on disk
+@st.cache_data(ttl=3600, max_entries=256, show_spinner=False)
+def _synthesize_speech(text, lang_code):
+    """Synthesizes the text with a single edge-tts request and returns the MP3 bytes. Callers run it
+    on TTS_MAX_CONCURRENCY-sized pools. Cached, so replays of the same (text, lang) skip the network."""
+    voice = EDGE_TTS_VOICES.get(lang_code)
+    if not voice:
+        raise ValueError(f"No TTS voice configured for language code '{lang_code}'.")
+    return asyncio.run(_synthesize(text, voice))
+
 def generate_speech(text, lang_code):
-    """Generates speech audio bytes using gTTS."""
+    """Starts speech generation with edge-tts on background threads, one sentence-packed chunk
+    per task. Returns a list of Futures for the chunks' MP3 bytes in order (see collect_speech)."""
     if not text:
         log_message("Cannot generate speech from empty text.")
-        return None
+        return []
+    # Normalize whitespace so trivially different strings share cache entries
+    text = _WS_RE.sub(' ', text).strip()
+    # The first sentence gets its own chunk so the first clip is short and playable quickly
+    first_sentence, *rest = SENTENCE_SPLIT_RE.split(text, maxsplit=1)
+    chunks = pack_sentences(first_sentence, TTS_CHUNK_SIZE) + (pack_sentences(rest[0], TTS_CHUNK_SIZE) if rest else [])
+    log_message(f"Generating speech in language: {lang_code} ({len(chunks)} chunk(s))...")
+    executor = make_executor(max(1, min(TTS_MAX_CONCURRENCY, len(chunks))))
+    # Chunks synthesize concurrently; submission order is kept so playback order is too
+    futures = [executor.submit(_synthesize_speech, chunk, lang_code) for chunk in chunks]
+    executor.shutdown(wait=False) # Worker threads exit once the audio is done
+    return futures
+
+def collect_speech(future):
+    """Returns the audio bytes of a finished generate_speech chunk Future, or None if synthesis failed."""
     try:
-        log_message(f"Generating speech in language: {lang_code}...")
-        tts = gTTS(text=text, lang=lang_code)
-        audio_fp = io.BytesIO()
-        tts.write_to_fp(audio_fp)
-        audio_fp.seek(0)
+        audio_bytes = future.result()
         log_message("Speech generated successfully.")
-        return audio_fp.getvalue()
+        return audio_bytes
     except Exception as e:
         log_message(f"Speech generation error: {str(e)}")
         st.error(f"Could not generate speech: {e}")
         return None
 
+# --- Translation Helpers ---
+TRANSLATE_MAX_CHUNK_SIZE = 4500 # Keep it safe (GoogleTranslator rejects > 5000 chars)
+TRANSLATE_MAX_WORKERS = 4
+SENTENCE_SPLIT_RE = re.compile(r'(?<=[.!?])\s+')
+# Transient errors worth retrying: rate limits, non-200 responses and dropped connections
+RETRYABLE_ERRORS = (TooManyRequests, RequestError, requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+
+def retry_with_backoff(max_attempts=4, base_delay=0.5, exceptions=RETRYABLE_ERRORS):
+    """Decorator that retries a call with exponential backoff on the given exceptions."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            for attempt in range(max_attempts):
+                try:
+                    return func(*args, **kwargs)
+                except exceptions:
+                    if attempt == max_attempts - 1:
+                        raise # Out of attempts, let the caller handle it
+                    time.sleep(base_delay * (2 ** attempt)) # 0.5s, 1s, 2s, ...
+        return wrapper
+    return decorator
+
+def pack_sentences(text, max_chunk_size=TRANSLATE_MAX_CHUNK_SIZE):
+    """Splits text at sentence boundaries and packs the sentences into chunks of at most max_chunk_size chars."""
+    chunks = []
+    current = ""
+    for sentence in SENTENCE_SPLIT_RE.split(text.strip()):
+        # A single sentence over the limit has no natural boundary; hard-split it
+        while len(sentence) > max_chunk_size:
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(sentence[:max_chunk_size])
+            sentence = sentence[max_chunk_size:]
+        if current and len(current) + 1 + len(sentence) > max_chunk_size:
+            chunks.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+    if current:
+        chunks.append(current)
+    return chunks
+
+@st.cache_data(ttl=3600, max_entries=128, show_spinner=False)
+@retry_with_backoff()
+def _translate_chunk(chunk, target_lang_code):
+    """Translates a single chunk, retrying on rate limits and connection errors."""
+    # GoogleTranslator keeps per-request params on the instance, so each call gets its own
+    translator = GoogleTranslator(source='auto', target=target_lang_code)
+    return translator.translate(chunk)
+
 def translate_if_needed(text, target_lang_code, target_lang_name):
     """Translates text if a target language is selected."""
     if not target_lang_code or target_lang_code == "en": # Assuming 'en' is the default/no translation
@@ -166,68 +304,267 @@ def translate_if_needed(text, target_lang_code, target_lang_name):
 
     try:
         log_message(f"Translating to {target_lang_name} ({target_lang_code})...")
-        translator = GoogleTranslator(source='auto', target=target_lang_code)
-        max_chunk_size = 4500 # Keep it safe
-        translated_text = ""
-        for i in range(0, len(text), max_chunk_size):
-            chunk = text[i:i+max_chunk_size]
-            if i > 0: time.sleep(0.2) # Small delay between chunks if needed
-            translated_text += translator.translate(chunk) + " " # Add space between chunks
+        chunks = pack_sentences(text)
+        # Chunks are independent network calls, so issue them in parallel; map() keeps them in order
+        with make_executor(max(1, min(TRANSLATE_MAX_WORKERS, len(chunks)))) as executor:
+            translated_chunks = list(executor.map(_translate_chunk, chunks, [target_lang_code] * len(chunks)))
+        translated_text = " ".join(translated_chunks) # Add space between chunks
         log_message("Translation successful.")
         return translated_text.strip()
     except Exception as e:
         log_message(f"Translation error: {str(e)}")
-        st.warning(f"Translation failed: {e}. Using original text.")
+        notify("warning", f"Translation failed: {e}. Using original text.")
         return text # Return original text if translation fails
 
-def get_gemini_response(prompt, image_bytes=None, text_input=None):
-    """Gets response from Gemini model."""
+# --- Image Helpers ---
+GEMINI_MAX_IMAGE_SIZE = (1568, 1568) # Larger images get downscaled by Gemini anyway
+
+@st.cache_data(ttl=3600, max_entries=16, show_spinner=False)
+def _decode_image(image_hash, _image_bytes):
+    """Decodes (and downscales) an uploaded image once; keyed on its hash, the raw bytes are not hashed again."""
+    img = Image.open(io.BytesIO(_image_bytes))
+    # thumbnail() first shrinks by an integer factor (DCT scaling while decoding JPEGs, reduce() otherwise),
+    # so LANCZOS only runs on an image at most reducing_gap times the target size
+    img.thumbnail(GEMINI_MAX_IMAGE_SIZE, Image.LANCZOS, reducing_gap=2.0)
+    img.load() # thumbnail() leaves images that already fit undecoded; decode inside this cached step
+    return img
+
+@st.cache_data(ttl=3600, max_entries=16, show_spinner=False)
+def _encode_for_gemini(image_hash, _image):
+    """Re-encodes the downscaled image as JPEG (quality 85) and returns an inline-data blob for Gemini."""
+    buf = io.BytesIO()
+    # JPEG has no alpha/palette; screenshots are opaque, so dropping alpha is fine
+    _image.convert("RGB").save(buf, "JPEG", quality=85, optimize=True)
+    return {"mime_type": "image/jpeg", "data": buf.getvalue()}
+
+def handle_image_upload():
+    """file_uploader callback: stores the image hash and the compact JPEG blob sent to Gemini
+    (also used for the preview) in session_state."""
+    uploaded = st.session_state.file_uploader
+    st.session_state.last_uploaded_image_hash = None
+    st.session_state.last_uploaded_image_blob = None
+    if not uploaded:
+        return
+    image_bytes = uploaded.getvalue()
+    image_hash = hashlib.blake2b(image_bytes, digest_size=16).hexdigest()
+    try:
+        img = _decode_image(image_hash, image_bytes)
+        blob = _encode_for_gemini(image_hash, img)
+        st.session_state.last_uploaded_image_hash = image_hash
+        st.session_state.last_uploaded_image_blob = blob
+        log_message(f"Image decoded ({img.width}x{img.height}), {len(image_bytes) // 1024} KB -> {len(blob['data']) // 1024} KB for Gemini.")
+    except Exception as img_err:
+        log_message(f"Error opening image: {img_err}")
+        st.error(f"Could not process uploaded image file: {img_err}")
+
+# --- Streaming Speech Pipeline ---
+STREAM_MIN_CHUNK_SIZE = 500 # Don't hand tiny fragments to TTS
+STREAM_FIRST_CHUNK_MIN_SIZE = 80 # ...except the first, cut at the first sentence end past this, so audio starts early
+STREAM_MAX_CHUNK_SIZE = 1900
+STREAM_TTS_MAX_WORKERS = 4 # Chunks cleaned/translated at once while streaming (TTS uses TTS_MAX_CONCURRENCY)
+
+def split_stream_buffer(buffer, min_size=STREAM_MIN_CHUNK_SIZE, max_size=STREAM_MAX_CHUNK_SIZE, first=False):
+    """Cuts completed chunks off the front of a streaming text buffer. Returns (chunks, remaining_buffer).
+    With first=True the first chunk ends at the earliest sentence end past STREAM_FIRST_CHUNK_MIN_SIZE."""
+    chunks = []
+    if first:
+        match = SENTENCE_SPLIT_RE.search(buffer, STREAM_FIRST_CHUNK_MIN_SIZE)
+        if match:
+            chunks.append(buffer[:match.end()].strip())
+            buffer = buffer[match.end():]
+        elif len(buffer) < max_size:
+            return chunks, buffer # Wait for the first sentence to complete
+    while len(buffer) >= min_size:
+        window = buffer[:max_size]
+        # Break preference: paragraph > line > sentence end, searched past min_size
+        cut = window.rfind('\n\n', min_size)
+        if cut == -1:
+            cut = window.rfind('\n', min_size)
+        if cut == -1:
+            sentence_ends = [m.end() for m in SENTENCE_SPLIT_RE.finditer(window, min_size)]
+            cut = sentence_ends[-1] if sentence_ends else -1
+        if cut == -1:
+            if len(buffer) < max_size:
+                break # Wait for more text rather than cutting mid-sentence
+            # Forced cut: last space, or hard cut if there is none
+            cut = window.rfind(' ', min_size)
+            if cut == -1:
+                cut = max_size
+        chunk = buffer[:cut].strip()
+        buffer = buffer[cut:]
+        if chunk:
+            chunks.append(chunk)
+    return chunks, buffer
+
+def _prepare_chunk(text, translate_lang_code):
+    """Cleans and translates one streamed chunk. Runs on a worker thread; errors propagate."""
+    cleaned = clean_text_for_speech(text)
+    translated = cleaned
+    if translate_lang_code and translate_lang_code != "en" and cleaned:
+        translated = " ".join(_translate_chunk(chunk, translate_lang_code) for chunk in pack_sentences(cleaned))
+    translated = _WS_RE.sub(' ', translated).strip()
+    return cleaned, translated
+
+def _speak_prepared(text_future, tts_lang_code):
+    """Synthesizes a chunk once _prepare_chunk has finished it. Runs on its own pool, so waiting
+    on the text never starves the workers producing it."""
+    _, translated = text_future.result()
+    return _synthesize_speech(translated, tts_lang_code) if translated else b""
+
+class GeminiResponseError(Exception):
+    """Raised when Gemini yields no usable text (not configured, blocked, empty or the call failed).
+    The message is shown to the user; as an exception it is never cached."""
+
+# Persisted to disk so restarts keep the (slow, paid) Gemini answers. Retention: Streamlit ignores ttl for
+# persisted caches and never prunes the disk copy (max_entries only bounds memory), so answers, including
+# the pasted text in their keys, stay in the app's Streamlit cache directory until "Clear cached answers"
+# in the sidebar (_cached_generate.clear(), which deletes the files) or the directory is deleted.
+# Clearing is also how to get a fresh answer for an input that was already explained.
+@st.cache_data(persist="disk", max_entries=64, show_spinner=False)
+def _cached_generate(prompt, image_hash, text_input, model_name, _model, _image=None, _on_text_chunk=None):
+    """Calls Gemini and returns the response text. Keyed on (prompt, image_hash, text_input, model_name);
+    the model object, image and callback are excluded from the key. Errors raise so they are not memoized."""
+    content = [prompt]
+    if _image is not None:
+        log_message("Sending image to Gemini...")
+        content.append(_image) # Pre-encoded JPEG blob or PIL image (see handle_image_upload)
+
+    elif text_input:
+        log_message("Sending text to Gemini...")
+        content.append(text_input) # Append the text directly
+
+    log_message(f"Generating content with model: {_model.model_name}...")
+    stream = _on_text_chunk is not None
+    response = _model.generate_content(content, stream=stream, request_options={"timeout": 120}) # Add timeout
+    if stream:
+        buffer = ""
+        first = True # Until the (short) first chunk has been emitted
+        for response_chunk in response: # Iterating also accumulates the full response
+            if not response_chunk.parts: continue
+            buffer += response_chunk.text
+            ready_chunks, buffer = split_stream_buffer(buffer, first=first)
+            first = first and not ready_chunks
+            for text_chunk in ready_chunks:
+                _on_text_chunk(text_chunk)
+        if buffer.strip():
+            _on_text_chunk(buffer.strip()) # Flush the tail
+    log_message("Received response from Gemini.")
+
+    # Safely access the text part & check for blocks
+    if not response.parts:
+         try:
+             # Log feedback if available
+             log_message(f"Gemini response empty. Prompt feedback: {response.prompt_feedback}")
+             block_reason = response.prompt_feedback.block_reason
+             safety_ratings = response.prompt_feedback.safety_ratings
+         except Exception:
+             log_message("Gemini response received but has no text parts and no feedback info.")
+             raise GeminiResponseError("Error: AI generated an empty response (possibly due to safety filters or content restrictions).")
+         raise GeminiResponseError(f"Error: AI response blocked. Reason: {block_reason}. Ratings: {safety_ratings}")
+    return response.text.strip()
+
+def get_gemini_response(prompt, image=None, image_hash=None, text_input=None, on_text_chunk=None):
+    """Gets response from Gemini model. If on_text_chunk is given, the response is streamed and
+    each completed chunk (see split_stream_buffer) is passed to it as soon as it arrives.
+    Identical (prompt, image_hash, text_input, model) requests are served from cache.
+    Raises GeminiResponseError on failure, so response text is never mistaken for an error message."""
     # Try to configure/get the model; it now handles API key checks internally
     model = configure_gemini()
     if not model:
         log_message("get_gemini_response: Cannot proceed, Gemini model not configured.")
-        # Return a clear error message that reflects the root cause
-        return "Error: Gemini model failed to configure. Check API Key and logs."
+        # Report a clear error message that reflects the root cause
+        raise GeminiResponseError("Error: Gemini model failed to configure. Check API Key and logs.")
 
-    try:
-        content = [prompt]
-        if image_bytes:
-            log_message("Sending image to Gemini...")
-            try:
-                img = Image.open(io.BytesIO(image_bytes))
-                content.append(img)
-            except Exception as img_err:
-                 log_message(f"Error opening image: {img_err}")
-                 st.error(f"Could not process uploaded image file: {img_err}")
-                 return "Error: Could not read image data."
-
-        elif text_input:
-            log_message("Sending text to Gemini...")
-            content.append(text_input) # Append the text directly
-
-        log_message(f"Generating content with model: {model.model_name}...")
-        response = model.generate_content(content, request_options={"timeout": 120}) # Add timeout
-        log_message("Received response from Gemini.")
-
-        # Safely access the text part & check for blocks
-        if not response.parts:
-             try:
-                 # Log feedback if available
-                 log_message(f"Gemini response empty. Prompt feedback: {response.prompt_feedback}")
-                 block_reason = response.prompt_feedback.block_reason
-                 safety_ratings = response.prompt_feedback.safety_ratings
-                 return f"Error: AI response blocked. Reason: {block_reason}. Ratings: {safety_ratings}"
-             except Exception:
-                 log_message("Gemini response received but has no text parts and no feedback info.")
-                 return "Error: AI generated an empty response (possibly due to safety filters or content restrictions)."
-        else:
-             return response.text.strip()
+    emitted_chunks = []
+    def forward_chunk(text_chunk):
+        emitted_chunks.append(text_chunk)
+        on_text_chunk(text_chunk)
 
+    try:
+        if image is not None and not image_hash:
+            raise ValueError("image_hash is required when sending an image (it is the cache key).")
+        result = _cached_generate(
+            prompt, image_hash if image is not None else None, text_input or "", model.model_name, model,
+            _image=image, _on_text_chunk=forward_chunk if on_text_chunk else None
+        )
+        if on_text_chunk and not emitted_chunks:
+            # Cache hit: nothing was streamed, so replay the cached text through the same chunker
+            log_message("Using cached Gemini response.")
+            ready_chunks, tail = split_stream_buffer(result, first=True)
+            for text_chunk in ready_chunks + ([tail.strip()] if tail.strip() else []):
+                on_text_chunk(text_chunk)
+        return result
+
+    except GeminiResponseError:
+        raise
     except Exception as e:
         log_message(f"Gemini API Error during generation: {str(e)}")
         # Check for specific API errors if possible (e.g., AuthenticationError, PermissionDenied)
-        st.error(f"⚠️ Error communicating with Gemini during generation: {e}")
-        return f"Error: Could not get response from AI during generation. Details: {e}"
+        raise GeminiResponseError(f"Error: Could not get response from AI during generation. Details: {e}") from e
+
+def get_gemini_speech(prompt, translate_lang_code, tts_lang_code, image=None, image_hash=None, text_input=None, preview=None):
+    """Streams a Gemini explanation and pipelines each chunk through clean -> translate -> TTS while
+    generation continues. Returns (gemini_result, speech) where speech is (cleaned_text, text_to_speak,
+    audio_futures), or None if the caller should process the full text itself. Only the text is waited for;
+    audio_futures are the chunks' MP3 Futures in order, attached by the output fragment as they finish.
+    While it runs, the text and audio finished so far are shown in the optional preview placeholder.
+    GeminiResponseError propagates (already-started chunks are cancelled)."""
+    text_executor = make_executor(STREAM_TTS_MAX_WORKERS)
+    audio_executor = make_executor(TTS_MAX_CONCURRENCY)
+    chunk_futures = [] # (text_future, audio_future) per streamed chunk, in stream order
+    handed_off = False
+    shown = [None] # (texts, clips) currently in the preview
+
+    def show_progress():
+        """Renders the chunks finished so far, in order from the start, into the preview placeholder."""
+        if preview is None:
+            return
+        texts, clips = [], []
+        for text_future, audio_future in chunk_futures:
+            if not text_future.done() or text_future.exception():
+                break
+            texts.append(text_future.result()[1])
+            if len(clips) == len(texts) - 1 and audio_future.done() and not audio_future.exception():
+                clips.append(audio_future.result())
+        if not texts or (len(texts), len(clips)) == shown[0]:
+            return # Nothing new; redrawing could restart a clip that is playing
+        shown[0] = (len(texts), len(clips))
+        with preview.container():
+            st.caption("Preview while the rest is generated (the full player replaces it when done)")
+            st.markdown(' '.join(text for text in texts if text))
+            for clip in clips:
+                if clip: st.audio(clip, format=TTS_AUDIO_FORMAT)
+
+    def on_text_chunk(chunk):
+        text_future = text_executor.submit(_prepare_chunk, chunk, translate_lang_code)
+        chunk_futures.append((text_future, audio_executor.submit(_speak_prepared, text_future, tts_lang_code)))
+        show_progress()
+
+    try:
+        gemini_result = get_gemini_response(
+            prompt, image=image, image_hash=image_hash, text_input=text_input, on_text_chunk=on_text_chunk
+        )
+        if not chunk_futures:
+            return gemini_result, None
+        # Wait for every chunk's text, refreshing the preview as text and early audio finish
+        text_futures = [text_future for text_future, _ in chunk_futures]
+        while wait(text_futures, timeout=AUDIO_POLL_INTERVAL).not_done:
+            show_progress()
+        try:
+            texts = [text_future.result() for text_future in text_futures] # In submission order
+        except Exception as e:
+            log_message(f"Streaming speech pipeline failed, falling back to full-text processing: {e}")
+            return gemini_result, None
+        log_message(f"Speech pipeline prepared {len(texts)} chunk(s); audio attaches as it finishes.")
+        cleaned_text = ' '.join(cleaned for cleaned, _ in texts)
+        text_to_speak = ' '.join(translated for _, translated in texts if translated)
+        # Chunks that translated to nothing have no audio to play
+        audio_futures = [audio_future for (_, translated), (_, audio_future) in zip(texts, chunk_futures) if translated]
+        handed_off = True
+        return gemini_result, (cleaned_text, text_to_speak, audio_futures)
+    finally:
+        text_executor.shutdown(wait=False, cancel_futures=True)
+        audio_executor.shutdown(wait=False, cancel_futures=not handed_off) # Handed-off audio keeps running
 
 
 # --- Prompts ---
@@ -287,11 +624,292 @@ Address the student's feedback or question and provide a revised or clarified ex
 8.  **Clarity First:** Ensure the final text flows well when read aloud.
 """
 
+# --- Output Rendering ---
+def render_log():
+    """Log display: all lines as one st.code block (a single element instead of one caption per line).
+    Rendered as a fragment that polls while background audio is pending."""
+    with st.container(height=300):
+        st.code("\n".join(st.session_state.log_messages), language=None, wrap_lines=True)
+
+AUDIO_POLL_INTERVAL = 0.5 # Seconds between fragment reruns while TTS chunks are pending
+
+def attach_finished_audio():
+    """Moves finished background TTS chunks, in order, from current_audio_futures to current_audio_chunks.
+    Once nothing is pending, the chunks are merged into one clip so a single player plays it all."""
+    ss = st.session_state
+    pending_audio = ss.current_audio_futures
+    if not pending_audio:
+        return
+    while pending_audio and pending_audio[0].done():
+        audio_chunk = collect_speech(pending_audio.pop(0))
+        if not audio_chunk:
+             for future in pending_audio: future.cancel()
+             pending_audio.clear()
+             ss.current_text_to_speak += "\n\n(Error generating audio for this text)"
+             log_message("Audio generation failed.")
+             break
+        ss.current_audio_chunks.append(audio_chunk)
+    if not pending_audio and len(ss.current_audio_chunks) > 1:
+        # edge-tts returns plain MP3 frames, so the clips concatenate into one playable stream
+        ss.current_audio_chunks = [b"".join(ss.current_audio_chunks)]
+
+def result_panel():
+    """Text, audio players and playback speed. Rendered as a fragment: the speed slider reruns only
+    this panel, and while background TTS chunks are pending it reruns on its own every
+    AUDIO_POLL_INTERVAL so each finished clip appears without a full-script rerun."""
+    ss = st.session_state
+    # On a full run the script body has just attached finished audio (and chosen run_every from what is left);
+    # only the fragment's own reruns attach here, and the one that empties the queue turns polling off
+    if not ss.pop('audio_attached_this_run', False) and ss.current_audio_futures:
+        attach_finished_audio()
+        if not ss.current_audio_futures:
+            st.rerun() # Everything attached: one full rerun turns the polling off
+    pending_audio = ss.current_audio_futures
+
+    # Text Display Area
+    st.subheader("Text Content")
+    st.text_area(
+        label="Text Content (Read Only)", value=ss.current_text_to_speak,
+        height=200, key="spoken_text_display", disabled=True
+    )
+
+    # Audio Player Area
+    st.subheader("Audio Output")
+    # --- Speed Control Slider --- (inside the fragment, so moving it doesn't rerun the whole page)
+    ss.audio_speed = st.slider(
+        "Audio Speed", min_value=0.5, max_value=2.0,
+        value=ss.get('audio_speed', 1.0), step=0.1,
+        help="Adjust the playback speed of the generated audio.",
+        key="speed_slider"
+    )
+    audio_placeholder = st.empty() # Create a placeholder for the audio + JS script
+
+    if ss.current_audio_chunks:
+        # One player per chunk only while audio is still arriving (so the first can play while the rest generate);
+        # when all of it is done attach_finished_audio has merged it into a single clip
+        with audio_placeholder.container():
+            for audio_chunk in ss.current_audio_chunks:
+                st.audio(audio_chunk, format=TTS_AUDIO_FORMAT)
+            if pending_audio:
+                st.caption("Generating the rest of the audio...")
+
+        # --- JavaScript Injection for Speed Control ---
+        speed = ss.get('audio_speed', 1.0)
+        js_code = f"""
+            <script>
+                var speed = {speed}; // Get speed from Python
+                var audioElements = document.querySelectorAll('audio');
+                // Audio may be split across several players (one per chunk), so set them all
+                audioElements.forEach(function(audioElement) {{
+                    // Set rate only if it's different to avoid unnecessary changes/potential glitches
+                    if (audioElement.playbackRate !== speed) {{
+                         audioElement.playbackRate = speed;
+                         // console.log("Audio playbackRate set to:", speed); // Debug
+                    }}
+                }});
+                // Set interval to periodically check and set speed for dynamic elements
+                // This is a fallback/robustness measure, might not be strictly needed
+                // Clears previous interval if exists
+                // if (window.audioSpeedInterval) {{ clearInterval(window.audioSpeedInterval); }}
+                // window.audioSpeedInterval = setInterval(function() {{
+                //     var audioElements = document.querySelectorAll('audio');
+                //     if (audioElements.length > 0) {{
+                //         var audioElement = audioElements[audioElements.length - 1];
+                //         if (audioElement.playbackRate !== speed) {{
+                //             audioElement.playbackRate = speed;
+                //         }}
+                //     }}
+                // }}, 500); // Check every 500ms
+            </script>
+            """
+        # Inject the JavaScript using st.components.v1.html right after the audio
+        components.html(js_code, height=0) # Key might cause issues if speed changes rapidly
+
+    elif pending_audio:
+         audio_placeholder.caption("Generating audio...") # Show message in placeholder
+    else:
+        audio_placeholder.caption("Audio will appear here once generated.") # Show message in placeholder
+
+
+# --- Languages ---
+TTS_LANGUAGES = {
+    "English (US)": "en",
+    "English (UK)": "en-gb",
+    "Spanish": "es",
+    "French": "fr",
+    "German": "de",
+    "Italian": "it",
+    "Japanese": "ja",
+    "Telugu": "te",
+    "Hindi": "hi"
+}
+TRANSLATION_LANGUAGES = {
+    "None (Original Language)": None,
+    "Telugu": "te",
+    "Hindi": "hi",
+    "English": "en", # Useful if original is different
+    "Spanish": "es",
+    "French": "fr",
+    "German": "de"
+}
+# Selectbox option lists and reverse lookups, built once instead of on every rerun
+TTS_LANGUAGE_NAMES = list(TTS_LANGUAGES)
+TRANSLATION_LANGUAGE_NAMES = list(TRANSLATION_LANGUAGES)
+_TTS_CODE_TO_INDEX = {code: i for i, code in enumerate(TTS_LANGUAGES.values())}
+_TRANS_NAME_TO_INDEX = {name: i for i, name in enumerate(TRANSLATION_LANGUAGES)}
+
+# --- Processing Logic ---
+def queue_action(action):
+    """Button on_click callback: clears the previous results and queues the action. It runs at the end
+    of the following script run (run_pending_action), after the inputs have rendered disabled."""
+    st.session_state.update(
+        pending_action=action, action_notices=[],
+        current_audio_chunks=[], current_audio_futures=[], current_text_to_speak=""
+    )
+
+def run_pending_action():
+    """Runs the queued action, then reruns once so the inputs are enabled again and the results render.
+    A rerun that interrupts it leaves pending_action set, so the next run just starts it again."""
+    run_action(st.session_state.pending_action)
+    st.session_state.pending_action = None
+    st.rerun()
+
+def run_action(action):
+    """Runs one action (explain/read/follow-up) and stores its text and audio futures in session state."""
+    ss = st.session_state # session_state goes through a proxy; read inputs once into locals
+    if not ss.get('api_key_configured', False): # Final check before API call
+        log_message(f"Processing blocked for action '{action}': API not configured.")
+        notify("error", "Cannot process request. API Key is not configured correctly.")
+        return
+
+    image_blob = ss.last_uploaded_image_blob # Compact JPEG of the screenshot, sent to Gemini
+    image_hash = ss.last_uploaded_image_hash
+    translate_lang_code = ss.translate_lang_code
+    translate_lang_name = ss.translate_lang_name
+    tts_lang_code = ss.tts_lang_code
+    last_explanation = ss.last_explanation
+    pasted_text = ss.get("pasted_text_area", "")
+    feedback_text = ss.get("feedback_input", "")
+
+    log_message(f"Starting processing for action: {action}")
+    action_label = action.replace('_', ' ')
+    # st.status shows progress in the output column; the inputs stay disabled until run_pending_action reruns
+    preview = st.empty() # Streamed explanations show their first text and audio here while generating
+    with st.status(f"🧠 Processing: {action_label}...", expanded=False) as status:
+        try:
+            final_text_to_speak = ""
+            gemini_result = "" # Store raw result
+            streamed_speech = None # (cleaned, text_to_speak, audio_futures) when the streaming pipeline handled it
+
+            # --- Action Execution Logic ---
+            if action == "explain_image":
+                log_message("Processing screenshot explanation...")
+                if image_blob is None: raise ValueError("No image data found for explanation.")
+                prompt = EXPLAIN_PROMPT_BASE
+                gemini_result, streamed_speech = get_gemini_speech(
+                    prompt, translate_lang_code, tts_lang_code,
+                    image=image_blob, image_hash=image_hash, preview=preview
+                )
+
+            elif action == "read_image":
+                log_message("Processing screenshot reading...")
+                if image_blob is None: raise ValueError("No image data found for reading.")
+                prompt = READ_PROMPT_IMAGE
+                gemini_result = get_gemini_response(
+                    prompt, image=image_blob, image_hash=image_hash
+                )
+
+            elif action == "explain_text":
+                log_message("Processing pasted text explanation...")
+                if not pasted_text: raise ValueError("No pasted text found for explanation.")
+                prompt = EXPLAIN_PROMPT_BASE
+                gemini_result, streamed_speech = get_gemini_speech(
+                    prompt, translate_lang_code, tts_lang_code,
+                    text_input=pasted_text, preview=preview
+                )
+
+            elif action == "read_text":
+                log_message("Processing pasted text reading...")
+                if not pasted_text: raise ValueError("No pasted text found for reading.")
+                # Directly use the pasted text, maybe minimal cleaning
+                cleaned_text = _WS_RE.sub(' ', pasted_text).strip()
+                ss.last_explanation = "" # Reading doesn't set context
+                # Directly translate/speak without Gemini call for "read"
+                final_text_to_speak = translate_if_needed(cleaned_text, translate_lang_code, translate_lang_name)
+                gemini_result = None # Mark that Gemini wasn't called for this path
+
+            elif action == "follow_up":
+                log_message("Processing follow-up response...")
+                if not feedback_text: raise ValueError("No follow-up text provided.")
+                if not last_explanation: raise ValueError("No previous explanation context found for follow-up.")
+                prompt = FOLLOW_UP_PROMPT.format(
+                    previous_explanation=last_explanation,
+                    user_feedback=feedback_text
+                )
+                gemini_result, streamed_speech = get_gemini_speech(
+                    prompt, translate_lang_code, tts_lang_code, preview=preview
+                )
+
+            # --- Process Gemini Result (if called) ---
+            # (Gemini failures raise GeminiResponseError and are handled below)
+            if gemini_result is not None: # Check if Gemini was actually called
+                # Actions that need cleaning and translation after Gemini
+                if action in ["explain_image", "explain_text", "follow_up"] and streamed_speech:
+                    # Already cleaned and translated chunk by chunk while streaming (audio may still be running)
+                    cleaned_explanation, final_text_to_speak, _ = streamed_speech
+                    ss.last_explanation = cleaned_explanation
+                elif action in ["explain_image", "explain_text", "follow_up"]:
+                    cleaned_explanation = clean_text_for_speech(gemini_result)
+                    ss.last_explanation = cleaned_explanation
+                    final_text_to_speak = translate_if_needed(cleaned_explanation, translate_lang_code, translate_lang_name)
+                # Action that needs less cleaning after Gemini
+                elif action == "read_image":
+                    cleaned_text = _WS_RE.sub(' ', gemini_result).strip()
+                    ss.last_explanation = "" # Reading doesn't set context
+                    final_text_to_speak = translate_if_needed(cleaned_text, translate_lang_code, translate_lang_name)
+                # else condition should not be met if gemini_result is not None
+
+            # --- Generate Audio ---
+            audio_futures = []
+            if final_text_to_speak:
+                if streamed_speech and streamed_speech[2]:
+                    audio_futures = streamed_speech[2] # Started during streaming, still finishing
+                else:
+                    # Synthesize in the background so the text renders right away;
+                    # the output column attaches each chunk's audio as it completes
+                    audio_futures = generate_speech(final_text_to_speak, tts_lang_code)
+            else:
+                log_message("No text generated or extracted to speak.")
+                final_text_to_speak = "(No content was generated or extracted)"
+            # Publish the results in one place (queue_action already cleared the previous ones)
+            ss.update(current_text_to_speak=final_text_to_speak, current_audio_futures=audio_futures)
+            # Expand if something (e.g. a translation fallback) left a warning inside the box
+            status.update(label=f"Done: {action_label}", state="complete", expanded=bool(ss.action_notices))
+
+        except GeminiResponseError as e:
+            # Shown as an error and as the text content; no audio is generated for it
+            log_message(f"Gemini returned an error: {e}")
+            ss.current_text_to_speak = str(e)
+            notify("error", str(e))
+            status.update(label=f"Failed: {action_label}", state="error", expanded=True)
+        except Exception as e:
+            log_message(f"Error during processing action '{action}': {str(e)}")
+            if DEBUG: log_message(f"Traceback: {traceback.format_exc(limit=-5)}")
+            notify("error", f"An error occurred during '{action}': {e}")
+            ss.current_text_to_speak = f"Error during {action}: {e}"
+            status.update(label=f"Failed: {action_label}", state="error", expanded=True)
+        finally:
+            log_message(f"Finished processing action: {action}")
+
+
 # --- Streamlit App Layout ---
 st.set_page_config(layout="wide")
 st.title("👁️‍🗨️ Screen Teacher AI")
 st.write("Hare Krishna! Upload a screenshot or paste text, and I'll explain it or read it aloud.")
 
+# A button queued an action: it runs at the end of this run, with every input rendered disabled meanwhile
+is_busy = st.session_state.pending_action is not None
+
 # --- Sidebar ---
 with st.sidebar:
     st.header("🔑 API Key Status")
@@ -313,85 +931,41 @@ with st.sidebar:
 
     st.header("⚙️ Settings")
 
-    # --- FIX: Use the full dictionaries here ---
-    tts_languages = {
-        "English (US)": "en",
-        "English (UK)": "en-gb",
-        "Spanish": "es",
-        "French": "fr",
-        "German": "de",
-        "Italian": "it",
-        "Japanese": "ja",
-        "Telugu": "te",
-        "Hindi": "hi"
-    }
-    translation_languages = {
-        "None (Original Language)": None,
-        "Telugu": "te",
-        "Hindi": "hi",
-        "English": "en", # Useful if original is different
-        "Spanish": "es",
-        "French": "fr",
-        "German": "de"
-    }
-    # --- End of FIX ---
-
-    # Language Selection (using the full dictionaries now)
+    # Language Selection (dictionaries and index lookups live at module scope)
     # Safely get current index or default to 0
-    try:
-        tts_index = list(tts_languages.values()).index(st.session_state.tts_lang_code)
-    except ValueError:
-        tts_index = 0 # Default to first language if current code not found
-
-    try:
-        trans_index = list(translation_languages.keys()).index(st.session_state.translate_lang_name)
-    except ValueError:
-        trans_index = 0 # Default to "None" if current name not found
+    tts_index = _TTS_CODE_TO_INDEX.get(st.session_state.tts_lang_code, 0) # Default to first language if current code not found
+    trans_index = _TRANS_NAME_TO_INDEX.get(st.session_state.translate_lang_name, 0) # Default to "None" if current name not found
 
 
     selected_tts_lang_name = st.selectbox(
         "🗣️ TTS Language",
-        options=list(tts_languages.keys()),
-        index=tts_index,
+        options=TTS_LANGUAGE_NAMES,
+        index=tts_index, disabled=is_busy,
         help="The language for the audio voice."
     )
     selected_translate_lang_name = st.selectbox(
         "🌐 Translate Output To",
-        options=list(translation_languages.keys()),
-        index=trans_index,
+        options=TRANSLATION_LANGUAGE_NAMES,
+        index=trans_index, disabled=is_busy,
         help="Translate the AI's response before converting to speech."
     )
 
     # Update state if changed (no rerun needed here)
     # Check if the selected key exists before accessing the dictionary
-    if selected_tts_lang_name in tts_languages:
-        st.session_state.tts_lang_code = tts_languages[selected_tts_lang_name]
-    if selected_translate_lang_name in translation_languages:
-        st.session_state.translate_lang_code = translation_languages[selected_translate_lang_name]
+    if selected_tts_lang_name in TTS_LANGUAGES:
+        st.session_state.tts_lang_code = TTS_LANGUAGES[selected_tts_lang_name]
+    if selected_translate_lang_name in TRANSLATION_LANGUAGES:
+        st.session_state.translate_lang_code = TRANSLATION_LANGUAGES[selected_translate_lang_name]
         st.session_state.translate_lang_name = selected_translate_lang_name
 
-    # --- Add Speed Control Slider ---
-    st.header("Playback Speed")
-    current_speed = st.session_state.get('audio_speed', 1.0)
-    new_speed = st.slider(
-        "Audio Speed", min_value=0.5, max_value=2.0,
-        value=current_speed, step=0.1,
-        help="Adjust the playback speed of the generated audio.",
-        key="speed_slider"
-    )
-    if new_speed != current_speed:
-        st.session_state.audio_speed = new_speed
-        # Rerun might be needed if JS needs to re-apply immediately after slider change
-        # Comment out if it feels too disruptive:
-        # st.rerun()
-
+    # Gemini answers are kept on disk across restarts (see _cached_generate); this drops them
+    if st.button("🗑️ Clear cached answers", disabled=is_busy, help="Forget saved Gemini answers so the next request asks Gemini again."):
+        _cached_generate.clear()
+        log_message("Cleared cached Gemini answers.")
 
     st.markdown("---")
     st.header("📝 Log")
-    log_container = st.container(height=300)
-    # Display logs directly from session state
-    for msg in st.session_state.log_messages:
-        log_container.caption(msg)
+    log_slot = st.container() # Filled after the output column has attached finished audio (see below)
 
 # --- Main App Area ---
 col1, col2 = st.columns(2)
@@ -407,111 +981,60 @@ with col1: # Input Column
     st.subheader("Screenshot Analysis")
     uploaded_file = st.file_uploader(
         "Upload a Screenshot (PNG, JPG)", type=["png", "jpg", "jpeg"],
-        key="file_uploader", disabled=st.session_state.processing or not is_api_ready,
-        on_change=lambda: setattr(st.session_state, 'last_uploaded_image', st.session_state.file_uploader.getvalue() if st.session_state.file_uploader else None)
+        key="file_uploader", disabled=is_busy or not is_api_ready,
+        on_change=handle_image_upload
     )
-    # Update last_uploaded_image immediately if file is uploaded via callback
+    # last_uploaded_image_blob is set by the upload callback
     # Display the uploaded image if available
-    if st.session_state.last_uploaded_image:
-        st.image(st.session_state.last_uploaded_image, caption="Uploaded Screenshot", use_column_width=True)
+    if st.session_state.last_uploaded_image_blob is not None:
+        # Show the ready-made JPEG blob; a PIL image would be re-encoded by st.image on every rerun
+        st.image(st.session_state.last_uploaded_image_blob["data"], caption="Uploaded Screenshot", use_column_width=True)
 
 
     img_button_col1, img_button_col2 = st.columns(2)
-    if img_button_col1.button("🧠 Explain Screenshot", key="explain_img", disabled=st.session_state.processing or not st.session_state.last_uploaded_image or not is_api_ready):
-        if st.session_state.last_uploaded_image:
-            st.session_state.processing = True
-            st.session_state.action_trigger = "explain_image"
-            st.session_state.current_audio_data = None # Clear previous results
-            st.session_state.current_text_to_speak = ""
-            st.rerun()
-        else: st.warning("Please upload an image first.")
-
-    if img_button_col2.button("📖 Read Screenshot Text", key="read_img", disabled=st.session_state.processing or not st.session_state.last_uploaded_image or not is_api_ready):
-        if st.session_state.last_uploaded_image:
-            st.session_state.processing = True
-            st.session_state.action_trigger = "read_image"
-            st.session_state.current_audio_data = None
-            st.session_state.current_text_to_speak = ""
-            st.rerun()
-        else: st.warning("Please upload an image first.")
+    # Buttons only queue their action (see queue_action / run_pending_action)
+    img_button_col1.button(
+        "🧠 Explain Screenshot", key="explain_img", on_click=queue_action, args=("explain_image",),
+        disabled=is_busy or st.session_state.last_uploaded_image_blob is None or not is_api_ready
+    )
+    img_button_col2.button(
+        "📖 Read Screenshot Text", key="read_img", on_click=queue_action, args=("read_image",),
+        disabled=is_busy or st.session_state.last_uploaded_image_blob is None or not is_api_ready
+    )
 
 
     # Text Input
     st.subheader("Pasted Text Analysis")
     pasted_text = st.text_area(
         "Paste text here:", height=150, key="pasted_text_area",
-        disabled=st.session_state.processing or not is_api_ready
+        disabled=is_busy or not is_api_ready
     )
     text_button_col1, text_button_col2 = st.columns(2)
-    if text_button_col1.button("🧠 Explain Pasted Text", key="explain_txt", disabled=st.session_state.processing or not pasted_text or not is_api_ready):
-        st.session_state.processing = True
-        st.session_state.action_trigger = "explain_text"
-        st.session_state.current_audio_data = None
-        st.session_state.current_text_to_speak = ""
-        st.rerun()
-
-    if text_button_col2.button("📖 Read Pasted Text", key="read_txt", disabled=st.session_state.processing or not pasted_text or not is_api_ready):
-        st.session_state.processing = True
-        st.session_state.action_trigger = "read_text"
-        st.session_state.current_audio_data = None
-        st.session_state.current_text_to_speak = ""
-        st.rerun()
+    text_button_col1.button(
+        "🧠 Explain Pasted Text", key="explain_txt", on_click=queue_action, args=("explain_text",),
+        disabled=is_busy or not pasted_text or not is_api_ready
+    )
+    text_button_col2.button(
+        "📖 Read Pasted Text", key="read_txt", on_click=queue_action, args=("read_text",),
+        disabled=is_busy or not pasted_text or not is_api_ready
+    )
 
 with col2: # Output Column
     st.header("🔊 Output & Interaction")
-
-    # Text Display Area
-    st.subheader("Text Content")
-    st.text_area(
-        label="Text Content (Read Only)", value=st.session_state.current_text_to_speak,
-        height=200, key="spoken_text_display", disabled=True
-    )
-
-    # Audio Player Area
-    st.subheader("Audio Output")
-    audio_placeholder = st.empty() # Create a placeholder for the audio + JS script
-
-    if st.session_state.current_audio_data:
-        # Display audio player IN the placeholder
-        audio_placeholder.audio(st.session_state.current_audio_data, format="audio/mp3")
-
-        # --- JavaScript Injection for Speed Control ---
-        speed = st.session_state.get('audio_speed', 1.0)
-        js_code = f"""
-            <script>
-                var speed = {speed}; // Get speed from Python
-                var audioElements = document.querySelectorAll('audio');
-                if (audioElements.length > 0) {{
-                    // Target the last audio element assuming it's the one just added
-                    var audioElement = audioElements[audioElements.length - 1];
-                    // Set rate only if it's different to avoid unnecessary changes/potential glitches
-                    if (audioElement.playbackRate !== speed) {{
-                         audioElement.playbackRate = speed;
-                         // console.log("Audio playbackRate set to:", speed); // Debug
-                    }}
-                }}
-                // Set interval to periodically check and set speed for dynamic elements
-                // This is a fallback/robustness measure, might not be strictly needed
-                // Clears previous interval if exists
-                // if (window.audioSpeedInterval) {{ clearInterval(window.audioSpeedInterval); }}
-                // window.audioSpeedInterval = setInterval(function() {{
-                //     var audioElements = document.querySelectorAll('audio');
-                //     if (audioElements.length > 0) {{
-                //         var audioElement = audioElements[audioElements.length - 1];
-                //         if (audioElement.playbackRate !== speed) {{
-                //             audioElement.playbackRate = speed;
-                //         }}
-                //     }}
-                // }}, 500); // Check every 500ms
-            </script>
-            """
-        # Inject the JavaScript using st.components.v1.html right after the audio
-        components.html(js_code, height=0) # Key might cause issues if speed changes rapidly
-
-    elif st.session_state.processing:
-         audio_placeholder.caption("Generating audio...") # Show message in placeholder
-    else:
-        audio_placeholder.caption("Audio will appear here once generated.") # Show message in placeholder
+    # Errors/warnings from the last action (its own elements are gone after the rerun that ends it)
+    for kind, message in st.session_state.action_notices:
+        getattr(st, kind)(message)
+    action_slot = st.empty() # The running action's progress renders here
+
+    # Attach audio that is already done (e.g. served from cache) first, so polling only starts if some is still pending
+    attach_finished_audio()
+    st.session_state.audio_attached_this_run = True
+    audio_poll_every = AUDIO_POLL_INTERVAL if st.session_state.current_audio_futures else None
+    # Text + Audio (a fragment, so speed changes and attaching background audio don't rerun the whole page)
+    st.fragment(result_panel, run_every=audio_poll_every)()
+    # The log polls alongside it, so lines logged while audio attaches (e.g. per chunk) show up right away
+    with log_slot:
+        st.fragment(render_log, run_every=audio_poll_every)()
 
     st.markdown("---")
 
@@ -519,132 +1042,12 @@ with col2: # Output Column
     st.subheader("💬 Follow-up Question")
     user_feedback = st.text_input(
         "Ask a question about the last explanation:", key="feedback_input",
-        disabled=st.session_state.processing or not st.session_state.last_explanation or not is_api_ready
+        disabled=is_busy or not st.session_state.last_explanation or not is_api_ready
+    )
+    st.button(
+        "✉️ Send Response", key="send_follow_up", on_click=queue_action, args=("follow_up",),
+        disabled=is_busy or not user_feedback or not st.session_state.last_explanation or not is_api_ready
     )
-    if st.button("✉️ Send Response", key="send_follow_up", disabled=st.session_state.processing or not user_feedback or not st.session_state.last_explanation or not is_api_ready):
-        st.session_state.processing = True
-        st.session_state.action_trigger = "follow_up"
-        st.session_state.current_audio_data = None
-        st.session_state.current_text_to_speak = ""
-        st.rerun()
-
-
-# --- Processing Logic ---
-if st.session_state.processing:
-    action = st.session_state.get("action_trigger")
-    is_api_ready = st.session_state.get('api_key_configured', False) # Final check before API call
-
-    if action and is_api_ready: # Only proceed if action is set AND API is ready
-        log_message(f"Starting processing for action: {action}")
-        with st.spinner(f"🧠 Processing: {action.replace('_', ' ')}..."):
-            try:
-                final_text_to_speak = ""
-                gemini_result = "" # Store raw result
-
-                # --- Action Execution Logic ---
-                if action == "explain_image":
-                    log_message("Processing screenshot explanation...")
-                    if not st.session_state.last_uploaded_image: raise ValueError("No image data found for explanation.")
-                    prompt = EXPLAIN_PROMPT_BASE
-                    gemini_result = get_gemini_response(prompt, image_bytes=st.session_state.last_uploaded_image)
-
-                elif action == "read_image":
-                    log_message("Processing screenshot reading...")
-                    if not st.session_state.last_uploaded_image: raise ValueError("No image data found for reading.")
-                    prompt = READ_PROMPT_IMAGE
-                    gemini_result = get_gemini_response(prompt, image_bytes=st.session_state.last_uploaded_image)
-
-                elif action == "explain_text":
-                    log_message("Processing pasted text explanation...")
-                    current_pasted_text = st.session_state.get("pasted_text_area", "")
-                    if not current_pasted_text: raise ValueError("No pasted text found for explanation.")
-                    prompt = EXPLAIN_PROMPT_BASE
-                    gemini_result = get_gemini_response(prompt, text_input=current_pasted_text)
-
-                elif action == "read_text":
-                    log_message("Processing pasted text reading...")
-                    current_pasted_text = st.session_state.get("pasted_text_area", "")
-                    if not current_pasted_text: raise ValueError("No pasted text found for reading.")
-                    # Directly use the pasted text, maybe minimal cleaning
-                    cleaned_text = ' '.join(current_pasted_text.split())
-                    st.session_state.last_explanation = "" # Reading doesn't set context
-                    # Directly translate/speak without Gemini call for "read"
-                    final_text_to_speak = translate_if_needed(cleaned_text, st.session_state.translate_lang_code, st.session_state.translate_lang_name)
-                    gemini_result = None # Mark that Gemini wasn't called for this path
-
-                elif action == "follow_up":
-                    log_message("Processing follow-up response...")
-                    current_feedback = st.session_state.get("feedback_input", "")
-                    if not current_feedback: raise ValueError("No follow-up text provided.")
-                    if not st.session_state.last_explanation: raise ValueError("No previous explanation context found for follow-up.")
-                    prompt = FOLLOW_UP_PROMPT.format(
-                        previous_explanation=st.session_state.last_explanation,
-                        user_feedback=current_feedback
-                    )
-                    gemini_result = get_gemini_response(prompt)
-
-                # --- Process Gemini Result (if called) ---
-                if gemini_result is not None: # Check if Gemini was actually called
-                    if "Error:" not in gemini_result:
-                         # Actions that need cleaning and translation after Gemini
-                         if action in ["explain_image", "explain_text", "follow_up"]:
-                             cleaned_explanation = clean_text_for_speech(gemini_result)
-                             st.session_state.last_explanation = cleaned_explanation
-                             final_text_to_speak = translate_if_needed(cleaned_explanation, st.session_state.translate_lang_code, st.session_state.translate_lang_name)
-                         # Action that needs less cleaning after Gemini
-                         elif action == "read_image":
-                             cleaned_text = ' '.join(gemini_result.split())
-                             st.session_state.last_explanation = "" # Reading doesn't set context
-                             final_text_to_speak = translate_if_needed(cleaned_text, st.session_state.translate_lang_code, st.session_state.translate_lang_name)
-                         # else condition should not be met if gemini_result is not None
-                    else:
-                        # Pass Gemini error through
-                        final_text_to_speak = gemini_result
-                        log_message(f"Gemini returned an error: {final_text_to_speak}")
-
-                # --- Generate Audio ---
-                if final_text_to_speak and "Error:" not in final_text_to_speak :
-                    st.session_state.current_text_to_speak = final_text_to_speak
-                    st.session_state.current_audio_data = generate_speech(
-                        final_text_to_speak, st.session_state.tts_lang_code
-                    )
-                    if not st.session_state.current_audio_data:
-                         st.session_state.current_text_to_speak += "\n\n(Error generating audio for this text)"
-                         log_message("Audio generation failed.")
-                elif final_text_to_speak: # Handles both Gemini errors and other potential errors
-                    log_message(f"Skipping audio generation due to error/empty text: {final_text_to_speak[:100]}...") # Log snippet
-                    st.session_state.current_text_to_speak = final_text_to_speak
-                    st.session_state.current_audio_data = None
-                else:
-                    log_message("No text generated or extracted to speak.")
-                    st.session_state.current_text_to_speak = "(No content was generated or extracted)"
-                    st.session_state.current_audio_data = None
-
-            except Exception as e:
-                log_message(f"Error during processing action '{action}': {str(e)}")
-                log_message(f"Traceback: {traceback.format_exc()}")
-                st.error(f"An error occurred during '{action}': {e}")
-                st.session_state.current_text_to_speak = f"Error during {action}: {e}"
-                st.session_state.current_audio_data = None
-            finally:
-                log_message(f"Finished processing action: {action}")
-                st.session_state.processing = False
-                st.session_state.action_trigger = None
-                st.rerun() # Rerun one last time to update UI (enable buttons, show results, apply JS)
-
-    elif action and not is_api_ready:
-         log_message(f"Processing blocked for action '{action}': API not configured.")
-         st.error("Cannot process request. API Key is not configured correctly.")
-         st.session_state.processing = False # Ensure processing stops
-         st.session_state.action_trigger = None
-         st.rerun() # Update UI to show error and re-enable inputs if needed
-
-    elif not action and st.session_state.processing:
-         # Safety net: Processing was true, but action was lost
-         log_message("Warning: Processing state was True, but no action_trigger found. Resetting.")
-         st.session_state.processing = False
-         st.session_state.action_trigger = None
-         st.rerun()
 
 
 # --- Footer/Instructions ---
@@ -655,6 +1058,11 @@ st.markdown("""
 *   **Screenshot/Text:** Upload an image or paste text using the input fields in the left column.
 *   **Actions:** Click 'Explain' or 'Read' below the corresponding input.
 *   **Follow-up:** Use the input box in the right column to ask questions about the *last explanation*.
-*   **Settings:** Use the sidebar to change voice/translation language and playback speed.
-*   **Speed Control:** Adjust the 'Audio Speed' slider in the sidebar *before or during* playback.
-""")
\ No newline at end of file
+*   **Settings:** Use the sidebar to change voice/translation language.
+*   **Speed Control:** Adjust the 'Audio Speed' slider above the audio player *before or during* playback.
+""")
+
+# --- Run Queued Action --- (last, so the whole page has rendered with its inputs disabled)
+if is_busy:
+    with action_slot.container():
+        run_pending_action()
\ No newline at end of file